@@ -13,3 +13,10 @@ OPENAI_API_KEY = os.environ['OPENAI_API_KEY']  # Change to your space name
 PATH_NAME_SPLITTER = './splitted_docs.jsonl'
 PERSIST_DIRECTORY = './db/chroma/'
 EVALUATION_DATASET = '../data/evaluation_dataset.tsv'
+
+# Client layer (src/llm_client.py)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None  # e.g. http://localhost:8080/v1 for src/fake_openai_server.py
+OPENAI_RPM = int(os.environ.get('OPENAI_RPM', 3500))  # Requests per minute budget
+OPENAI_TPM = int(os.environ.get('OPENAI_TPM', 90000))  # Tokens per minute budget
+LOCAL_LLM_BASE_URL = os.environ.get('LOCAL_LLM_BASE_URL') or None  # OpenAI-compatible local server used as fallback
+LOCAL_LLM_MODEL = os.environ.get('LOCAL_LLM_MODEL', 'llama3')
@@ -1,10 +1,23 @@
+import os
+import html
+import json
 import streamlit as st
 from pdf2image import convert_from_path
 
+
+@st.cache_data
+def load_preview_index(index_path, mtime):
+    """Charge l'index des aperçus d'un fichier (mtime invalide le cache après une réindexation)."""
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
 class PDFViewer:
-    def __init__(self, source_data, file_paths):
+    def __init__(self, source_data, file_paths, preview_directory=None, passages=None):
         self.source_data = source_data
         self.file_paths = file_paths
+        self.preview_directory = preview_directory
+        self.passages = passages or {}
         self.initialize_states()
 
     def initialize_states(self):
@@ -47,7 +60,8 @@ class PDFViewer:
             args=(st.session_state.file_choice,),
         )
 
-        # Afficher la navigation et la page PDF
+        # Afficher les miniatures, la navigation et la page PDF
+        self.show_thumbnails(file_choice)
         self.show_navigation(file_choice)
         self.show_pdf(file_choice)
 
@@ -91,6 +105,12 @@ class PDFViewer:
         # Limiter le numéro de page
         page_number = max(min(st.session_state.page_number, max(all_pages)), min(all_pages))
 
+        # Afficher la miniature immédiatement, puis la remplacer par la page en pleine résolution
+        placeholder = st.empty()
+        thumbnail = self.get_thumbnail_path(file_choice, page_number)
+        if thumbnail:
+            placeholder.image(thumbnail, caption=f"Page {page_number} du fichier {file_choice} (chargement...)", use_container_width=True)
+
         # Convertir et afficher la page PDF
         try:
             file_path = self.file_paths[file_choice]
@@ -99,6 +119,68 @@ class PDFViewer:
                 first_page=page_number,
                 last_page=page_number,
             )
-            st.image(pages[0], caption=f"Page {page_number} du fichier {file_choice}")
+            placeholder.image(pages[0], caption=f"Page {page_number} du fichier {file_choice}")
         except Exception as e:
             st.error(f"Erreur lors de l'affichage de la page : {e}")
+
+        self.show_passages(file_choice, page_number)
+
+    def get_preview_index(self, file_choice):
+        """Retourne l'index des aperçus générés à l'indexation, ou None s'il n'existe pas."""
+        if not self.preview_directory:
+            return None
+        index_path = os.path.join(self.preview_directory, file_choice, "index.json")
+        if not os.path.exists(index_path):
+            return None
+        return load_preview_index(index_path, os.path.getmtime(index_path))
+
+    def get_thumbnail_path(self, file_choice, page_number):
+        """Retourne le chemin de la miniature d'une page, ou None."""
+        index = self.get_preview_index(file_choice)
+        if index is None:
+            return None
+        thumbnail = index["pages"].get(str(page_number), {}).get("thumbnail")
+        return os.path.join(self.preview_directory, file_choice, thumbnail) if thumbnail else None
+
+    def show_thumbnails(self, file_choice):
+        """Affiche les miniatures des pages sources ; un clic sélectionne la page."""
+        all_pages = self.get_all_pages(file_choice)
+        if not all_pages or self.get_preview_index(file_choice) is None:
+            return
+
+        columns = st.columns(min(len(all_pages), 6))
+        for i, page in enumerate(all_pages):
+            with columns[i % len(columns)]:
+                thumbnail = self.get_thumbnail_path(file_choice, page)
+                if thumbnail:
+                    st.image(thumbnail, use_container_width=True)
+                st.button(f"Page {page}", key=f"thumbnail-{file_choice}-{page}", on_click=self.update_page_number, args=(page,))
+
+    @staticmethod
+    def highlight_text(text, ranges):
+        """Retourne le texte en HTML avec les passages (début, fin) surlignés."""
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        parts = []
+        position = 0
+        for start, end in merged:
+            parts.append(html.escape(text[position:start]))
+            parts.append(f"<mark>{html.escape(text[start:end])}</mark>")
+            position = end
+        parts.append(html.escape(text[position:]))
+        return f"<div style='white-space: pre-wrap'>{''.join(parts)}</div>"
+
+    def show_passages(self, file_choice, page_number):
+        """Affiche le texte de la page avec les passages utilisés pour la réponse surlignés."""
+        ranges = self.passages.get(file_choice, {}).get(page_number, [])
+        index = self.get_preview_index(file_choice)
+        if not ranges or index is None:
+            return
+        text = index["pages"].get(str(page_number), {}).get("text", "")
+        with st.expander("Passages utilisés pour la réponse", expanded=True):
+            st.markdown(self.highlight_text(text, ranges), unsafe_allow_html=True)
@@ -11,10 +11,26 @@ class SourceOrganizer:
         """
         self.sources_string = sources_string
         self.organized_sources = defaultdict(list)
+        self.passages = defaultdict(lambda: defaultdict(list))
         self._process_sources()
 
     def get_organized_sources(self): 
         return self.organized_sources
+
+    def get_passages(self):
+        return self.passages
+
+    def add_passages(self, documents):
+        """
+        Record the position of the retrieved chunks in their page, to highlight them in the viewer.
+        :param documents: Retrieved Document objects, with "source", "page" and "start_index" metadata.
+        """
+        for doc in documents:
+            start = doc.metadata.get("start_index", -1)
+            if start is None or start < 0:
+                continue
+            page = doc.metadata.get("page")
+            self.passages[doc.metadata.get("source")][page].append((start, start + len(doc.page_content)))
     
     def _process_sources(self):
         """Parse the sources string and organize it by document and pages."""
@@ -63,12 +79,14 @@ class SourceOrganizer:
         """
         Génère un dictionnaire mappant les noms de fichiers PDF aux chemins réels.
         :param folder_path: Chemin du dossier contenant les fichiers PDF.
-        :return: Dictionnaire {nom_fichier: chemin_complet}.
+        :return: Dictionnaire {source: chemin_complet}.
         """
         file_paths = {}
-        for file_name in os.listdir(folder_path):
-            if file_name.endswith(".pdf") and file_name in self.organized_sources:
-                file_paths[file_name] = os.path.join(folder_path, file_name)
+        # Les sources sont des chemins relatifs au dossier, ex. "Marketing/cours.pdf"
+        for source in self.organized_sources:
+            file_path = os.path.join(folder_path, source)
+            if source.endswith(".pdf") and os.path.exists(file_path):
+                file_paths[source] = file_path
         return file_paths
     
 
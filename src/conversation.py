@@ -0,0 +1,137 @@
+import hashlib
+import logging
+from collections import OrderedDict
+import tiktoken
+
+
+class ConversationMemory:
+    """Session-scoped chat history bounded by a token window, with a cache of condensed questions."""
+    def __init__(self, max_tokens=1000, cache_size=128, encoding_name="cl100k_base"):
+        """
+        :param max_tokens: Maximum number of tokens of history kept to condense a follow-up question.
+        :param cache_size: Maximum number of condensed questions cached for this session.
+        :param encoding_name: tiktoken encoding used to count tokens.
+        """
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self.messages = []
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        try:
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            logging.warning("Encodage tiktoken indisponible (%s), estimation approximative des tokens.", e)
+            self._encoding = None
+
+    def count_tokens(self, text):
+        """Return the number of tokens of text."""
+        if self._encoding is None:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text))
+
+    def truncate(self, text, max_tokens):
+        """Return the beginning of text fitting in max_tokens."""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        if self._encoding is None:
+            return text[:max(0, max_tokens - 1) * 4] + "…"
+        return self._encoding.decode(self._encoding.encode(text)[:max(0, max_tokens - 1)]) + "…"
+
+    def add_message(self, role, content):
+        """Append a message; the sources appended to the answers are not kept."""
+        content = content.split("\n\nSources:")[0].strip()
+        if content:
+            self.messages.append({"role": role, "content": content})
+            # L'historique lui-même reste borné : les messages qui ne tiennent plus dans la fenêtre sont oubliés
+            self.messages = self.messages[self._window_start():]
+
+    def load_messages(self, messages):
+        """
+        Replace the history with a list of messages.
+        :param messages: List of {"role": ..., "content": ...}, e.g. st.session_state.messages.
+        """
+        self.messages = []
+        for message in messages:
+            if isinstance(message.get("content"), str):
+                self.add_message(message["role"], message["content"])
+
+    def _last_user_index(self):
+        return next((i for i in range(len(self.messages) - 1, -1, -1) if self.messages[i]["role"] == "user"), None)
+
+    def _window(self):
+        """Return the [(index, message)] of the window, most recent first."""
+        last_user = self._last_user_index()
+        budget = self.max_tokens
+        # La dernière question de l'étudiant est toujours gardée : sans elle, rien à reformuler
+        question = None
+        if last_user is not None:
+            content = self.truncate(self.messages[last_user]["content"], budget)
+            question = {**self.messages[last_user], "content": content}
+            budget -= self.count_tokens(content)
+
+        window = []
+        for i in range(len(self.messages) - 1, -1, -1):
+            if i == last_user:
+                window.append((i, question))
+                continue
+            if budget <= 0:
+                if last_user is None or i < last_user:
+                    break
+                continue
+            # Le message qui dépasse le budget est tronqué plutôt qu'écarté
+            content = self.truncate(self.messages[i]["content"], budget)
+            budget -= self.count_tokens(content)
+            window.append((i, {**self.messages[i], "content": content}))
+        return window
+
+    def _window_start(self):
+        """Index of the oldest message still used by the window."""
+        window = self._window()
+        return window[-1][0] if window else len(self.messages)
+
+    def window(self):
+        """
+        Return the most recent messages fitting in max_tokens, oldest first.
+        The last user question is always kept, and the message overflowing the budget is truncated.
+        """
+        return [message for _, message in reversed(self._window())]
+
+    def format_history(self, messages=None):
+        """Format the history as a dialogue, oldest message first."""
+        messages = self.window() if messages is None else messages
+        speakers = {"user": "Étudiant", "assistant": "Professeur"}
+        return "\n".join(f"{speakers.get(m['role'], m['role'])} : {m['content']}" for m in messages)
+
+    def condense(self, question, llm, prompt):
+        """
+        Rewrite a follow-up question into a standalone query, using the cache when possible.
+        :param question: Question asked by the user.
+        :param llm: Model used to rewrite the question.
+        :param prompt: PromptTemplate with "chat_history" and "question" variables.
+        :return: Standalone question.
+        """
+        window = self.window()
+        # Pas de question précédente : rien à reformuler, on évite l'appel au LLM
+        if not any(m["role"] == "user" for m in window):
+            return question
+
+        chat_history = self.format_history(window)
+        key = hashlib.sha1(f"{chat_history}\n{question}".encode("utf-8")).hexdigest()
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        result = llm.invoke(prompt.format(chat_history=chat_history, question=question))
+        standalone = str(getattr(result, "content", result)).strip() or question
+
+        self._cache[key] = standalone
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return standalone
+
+    def cache_stats(self):
+        """Return the hits and misses of the condensed questions cache."""
+        return {"hits": self.hits, "misses": self.misses}
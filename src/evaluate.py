@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 #from help_desk import HelpDesk
 from dotenv import load_dotenv, find_dotenv
@@ -8,8 +9,9 @@ from project_config import EVALUATION_DATASET
 
 
 def predict(model, question):
-    result, sources = model.retrieval_qa_inference(question, verbose=False)
-    return result
+    result = model.retrieval_qa_inference(question, verbose=False)
+    # Les erreurs renvoient un simple message, sans sources
+    return result[0] if isinstance(result, tuple) else result
 
 
 def open_evaluation_dataset(filepath):
@@ -24,21 +26,23 @@ def get_levenshtein_distance(reference_text, prediction_text):
         reference=reference_text
     )
 
-def get_cosine_distance(reference_text, prediction_text):
-    evaluator = load_evaluator("embedding_distance", distance_metric=EmbeddingDistance.COSINE)
+def get_cosine_distance(reference_text, prediction_text, embeddings=None):
+    kwargs = {"embeddings": embeddings} if embeddings is not None else {}
+    evaluator = load_evaluator("embedding_distance", distance_metric=EmbeddingDistance.COSINE, **kwargs)
     return evaluator.evaluate_strings(
         prediction=prediction_text,
         reference=reference_text
     )
 
-def get_euclidian_distance(reference_text, prediction_text):
-    evaluator = load_evaluator("embedding_distance", distance_metric=EmbeddingDistance.EUCLIDEAN)
+def get_euclidian_distance(reference_text, prediction_text, embeddings=None):
+    kwargs = {"embeddings": embeddings} if embeddings is not None else {}
+    evaluator = load_evaluator("embedding_distance", distance_metric=EmbeddingDistance.EUCLIDEAN, **kwargs)
     return evaluator.evaluate_strings(
         prediction=prediction_text,
         reference=reference_text
     )
 
-def evaluate_dataset(model, dataset, verbose=True):
+def evaluate_dataset(model, dataset, verbose=True, output_path=EVALUATION_DATASET):
     predictions = []
     levenshtein_distances = []
     cosine_distances = []
@@ -46,8 +50,8 @@ def evaluate_dataset(model, dataset, verbose=True):
         prediction_text = predict(model, row['Questions'])
 
         # Distances
-        levenshtein_distance = get_levenshtein_distance(model, row['Réponses'].strip(), prediction_text.strip())
-        cosine_distance = get_cosine_distance(model, row['Réponses'].strip(), prediction_text.strip())
+        levenshtein_distance = get_levenshtein_distance(row['Réponses'].strip(), prediction_text.strip())
+        cosine_distance = get_cosine_distance(row['Réponses'].strip(), prediction_text.strip(), model.embeddings)
 
         if verbose:
             print("\n QUESTIONS \n", row['Questions'])
@@ -63,10 +67,26 @@ def evaluate_dataset(model, dataset, verbose=True):
     dataset['Prédiction'] = predictions
     dataset['Levenshtein_Distance'] = levenshtein_distances
     dataset['Cosine_Distance'] = cosine_distances
-    dataset.to_csv(EVALUATION_DATASET, index=False, sep= '\t')
+    if output_path:
+        dataset.to_csv(output_path, index=False, sep= '\t')
     return dataset
 
 
+def compare_rerank(dataset_path=EVALUATION_DATASET):
+    """Evaluate the dataset with the rerank stage off then on (lower distances are better)."""
+    from src.help_desk import HelpDesk
+    rows = []
+    for rerank in (False, True):
+        model = HelpDesk(new_db=False, rerank=rerank)
+        dataset = evaluate_dataset(model, open_evaluation_dataset(dataset_path), verbose=False, output_path=None)
+        rows.append({
+            "rerank": rerank,
+            "levenshtein_distance": dataset['Levenshtein_Distance'].mean(),
+            "cosine_distance": dataset['Cosine_Distance'].mean(),
+        })
+    return pd.DataFrame(rows)
+
+
 def run():
     dataset = open_evaluation_dataset(EVALUATION_DATASET)
     results = evaluate_dataset(model, dataset)
@@ -74,6 +94,11 @@ def run():
 
 if __name__ == '__main__':
     load_dotenv(find_dotenv())
+    if "--compare-rerank" in sys.argv[1:]:
+        # Lancé depuis la racine du dépôt (python -m src.evaluate), pour importer src.help_desk
+        dataset_path = os.path.join(os.path.dirname(__file__), "..", "data", "evaluation_dataset.tsv")
+        print(compare_rerank(dataset_path).to_string(index=False))
+        sys.exit(0)
     #model = HelpDesk(new_db=True)
     dataset = open_evaluation_dataset(EVALUATION_DATASET)
     evaluate_dataset(model, dataset)
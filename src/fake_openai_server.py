@@ -0,0 +1,123 @@
+import json
+import time
+import base64
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible API (chat completions and embeddings) with injectable latency and failures."""
+    latency = 0.2
+    jitter = 0.1
+    error_rate = 0.0
+    slow_rate = 0.0
+    slow_latency = 10.0
+    fail_requests = ()  # Numéros (à partir de 1) des requêtes refusées en 429, pour des tests déterministes
+    slow_requests = ()  # Numéros des requêtes servies après slow_latency
+    dimensions = 1536
+    answer = "Le **marketing mix** regroupe le produit, le prix, la distribution et la communication."
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _embedding(self, item):
+        """Deterministic unit vector for a string or a list of token ids."""
+        seed = int(hashlib.sha1(json.dumps(item).encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.RandomState(seed).normal(size=self.dimensions).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.requests += 1
+            number = self.server.requests
+
+        # Pannes simulées : quota dépassé ou réponse très lente
+        if number in self.fail_requests or random.random() < self.error_rate:
+            return self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "1"})
+        slow = number in self.slow_requests or random.random() < self.slow_rate
+        time.sleep(self.slow_latency if slow else max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if self.path.endswith("/chat/completions"):
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages", []))
+            completion_tokens = len(self.answer) // 4
+            return self._reply(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        if self.path.endswith("/embeddings"):
+            inputs = request.get("input", [])
+            # Une seule chaîne, ou une seule liste de tokens, est un lot d'un élément
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            data = []
+            for i, item in enumerate(inputs):
+                vector = self._embedding(item)
+                if request.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+            return self._reply(200, {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", "fake"),
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            })
+
+        return self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def serve(host="127.0.0.1", port=8080, **options):
+    """
+    Serve the fake API in a thread per request; point OPENAI_BASE_URL to http://host:port/v1.
+    Port 0 picks a free port, see server.server_port; server.requests counts the requests received.
+    :param options: Overrides of the FakeOpenAIHandler attributes (latency, error_rate, ...).
+    """
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), options)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.requests = 0
+    server.lock = threading.Lock()
+    logging.info("Fausse API OpenAI sur http://%s:%d/v1", host, server.server_port)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server to test the client layer offline.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429.")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests answered after --slow-latency.")
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(
+        args.host, args.port,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        slow_rate=args.slow_rate, slow_latency=args.slow_latency
+    ).serve_forever()
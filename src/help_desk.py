@@ -6,30 +6,41 @@ import numpy as np
 from src.evaluate import get_cosine_distance, get_euclidian_distance, get_levenshtein_distance
 from src.SourcesOrganizer import SourceOrganizer
 from .load_db import DataLoader
+from .pdf_watcher import PDFWatcher
+from .reranker import Reranker, RerankCompressor
+from .llm_client import get_chat_model, get_embeddings_model
+from openai import RateLimitError
 from collections import Counter, defaultdict
 from langchain.chains import RetrievalQA
+from langchain.retrievers import ContextualCompressionRetriever
 from langchain.prompts import PromptTemplate
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
-from project_config import (
-    OPENAI_API_KEY
-)
 
 class HelpDesk():
     """Create the necessary objects to create a QARetrieval chain"""
-    def __init__(self, new_db=True): 
+    def __init__(self, new_db=True, watch=False, loader=None, rerank=False, rerank_candidates=20, rerank_top_n=3, rerank_model=None): 
         self.new_db = new_db
+        self.watch = watch
+        self.rerank = rerank
+        self.rerank_candidates = rerank_candidates
+        self.rerank_top_n = rerank_top_n
+        self.reranker = Reranker(model_name=rerank_model) if self.rerank else None
+        self.loader = loader if loader is not None else DataLoader()
         self.template = self.get_template()
         self.embeddings = self.get_embeddings()
         self.llm = self.get_llm()
+        self.condense_llm = self.get_condense_llm()
         self.prompt = self.get_prompt()
+        self.condense_prompt = self.get_condense_prompt()
       #  self.OPENAI_API_KEY = CONFLUENCE_API_KEY
         if self.new_db:
-            self.db = DataLoader().set_db(self.embeddings)
+            self.db = self.loader.set_db(self.embeddings)
         else:
-            self.db = DataLoader().get_db(self.embeddings)
+            self.db = self.loader.get_db(self.embeddings)
 
-        self.retriever = self.db.as_retriever()
+        # Ingestion continue : les PDF déposés sont indexés sans redémarrer l'application
+        self.watcher = PDFWatcher(self.loader, self.db).start() if self.watch else None
+
+        self.retriever = self.get_retriever()
         self.retrieval_qa_chain = self.get_retrieval_qa()
 
 
@@ -61,22 +72,68 @@ class HelpDesk():
         )
         return prompt
     
-    def get_embeddings(self) -> OpenAIEmbeddings:
-        """Retourne les embeddings d'OpenAI"""
-        embeddings = OpenAIEmbeddings(
-              model="text-embedding-ada-002",  
-              openai_api_key= OPENAI_API_KEY 
+    def get_condense_template(self):
+        template = """
+        Voici une discussion entre un étudiant et son professeur de marketing :
+        -----
+        {chat_history}
+        -----
+        Reformule la dernière question de l'étudiant : {question}
+        en une question autonome, compréhensible sans la discussion, dans la même langue.
+        Ne réponds pas à la question, écris uniquement la question reformulée.
+        """
+        return template
+
+    def get_condense_prompt(self) -> PromptTemplate:
+        prompt = PromptTemplate(
+            template=self.get_condense_template(),
+            input_variables=["chat_history", "question"]
         )
+        return prompt
+
+    def condense_question(self, question: str, memory=None) -> str:
+        """Reformule une question de suivi en question autonome à partir de l'historique de la session."""
+        if memory is None:
+            return question
+        try:
+            return memory.condense(question, self.condense_llm, self.condense_prompt)
+        except Exception as e:
+            print(f"Erreur lors de la reformulation de la question : {e}")
+            return question
+
+    def get_embeddings(self):
+        """Retourne les embeddings d'OpenAI"""
+        embeddings = get_embeddings_model(model="text-embedding-ada-002")
         return embeddings
 
     def get_llm(self):
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.3,
-            openai_api_key= OPENAI_API_KEY 
-        )
+        """Retourne le LLM d'OpenAI, avec repli sur le modèle local s'il est configuré"""
+        llm = get_chat_model(model="gpt-3.5-turbo", temperature=0.3)
         return llm
+
+    def get_condense_llm(self):
+        """Retourne le LLM qui reformule les questions de suivi (le même que pour les réponses par défaut)"""
+        return self.llm
     
+    def get_retriever(self):
+        """Retourne le retriever ; avec le reranking, un large ensemble de candidats est réduit aux meilleurs morceaux."""
+        if not self.rerank:
+            return self.db.as_retriever()
+        retriever = ContextualCompressionRetriever(
+            base_compressor=RerankCompressor(reranker=self.reranker, top_n=self.rerank_top_n),
+            base_retriever=self.db.as_retriever(search_kwargs={"k": self.rerank_candidates})
+        )
+        return retriever
+
+    def cache_stats(self):
+        """Retourne les hits et misses des caches du modèle."""
+        return {"rerank": self.reranker.cache_stats()} if self.reranker else {}
+
+    def clear_caches(self):
+        """Vide les caches du modèle, par exemple entre deux mesures de charge."""
+        if self.reranker:
+            self.reranker.clear_cache()
+
     def get_retrieval_qa(self):
         chain_type_kwargs = {"prompt": self.prompt}
         qa = RetrievalQA.from_chain_type(
@@ -133,14 +190,18 @@ class HelpDesk():
 
         return "\n".join(formatted_sources)
     
-    def retrieval_qa_inference(self, question: str, verbose: bool = True) -> str:
+    def retrieval_qa_inference(self, question: str, verbose: bool = True, memory=None) -> str:
         
         """
         Interroge le modèle pour récupérer des documents et générer une réponse.
+        Si une mémoire de conversation est fournie, les questions de suivi sont d'abord reformulées.
         """
         try:
+            # Reformulation des questions de suivi (mise en cache par session)
+            query = self.condense_question(question, memory)
+
             # Exécution de la chaîne pour obtenir la réponse et les documents sources
-            result = self.retrieval_qa_chain({"query": question})
+            result = self.retrieval_qa_chain({"query": query})
 
             # Vérifier si une réponse a été générée
             answer = result.get("result", "").strip()
@@ -161,6 +222,7 @@ class HelpDesk():
             )
             sources = "\n".join(unique_sources).strip()
             sourcesOrg = SourceOrganizer(sources)
+            sourcesOrg.add_passages(source_documents)
             sources = sourcesOrg.to_string()
             if not sources:
                 sources = "Aucune source fournie."
@@ -168,13 +230,15 @@ class HelpDesk():
             # Affichage pour débogage si nécessaire
             if verbose:
                 print(f"Question: {question}")
+                if query != question:
+                    print(f"Standalone Question: {query}")
                 print(f"Generated Answer: {answer}")
                 print(f"Sources: {sources}")
 
-            tab =np.array([get_cosine_distance(answer,"Je n'ai pas assez d'informations pour répondre. 🤔")['score'],
-                   get_cosine_distance(answer, "Pourrais-tu préciser ta question ? 🧐")['score'], 
-                   get_cosine_distance(answer,"Ta question est hors de mon champs de compétences. 🤷‍♂️")['score'],
-                   get_cosine_distance(answer,"Bonjour! En tant que professeur spécialisé en marketing, je suis là pour répondre à ta question. Que puis-je faire pour t'aider aujourd'hui ?")['score']
+            tab =np.array([get_cosine_distance(answer,"Je n'ai pas assez d'informations pour répondre. 🤔", self.embeddings)['score'],
+                   get_cosine_distance(answer, "Pourrais-tu préciser ta question ? 🧐", self.embeddings)['score'], 
+                   get_cosine_distance(answer,"Ta question est hors de mon champs de compétences. 🤷‍♂️", self.embeddings)['score'],
+                   get_cosine_distance(answer,"Bonjour! En tant que professeur spécialisé en marketing, je suis là pour répondre à ta question. Que puis-je faire pour t'aider aujourd'hui ?", self.embeddings)['score']
                    ]
                    )
             
@@ -187,6 +251,11 @@ class HelpDesk():
             # Retourner la réponse avec les sources
             return f"{answer}" + Sources, sourcesOrg, Sources
 
+        except RateLimitError as e:
+            # Quota toujours dépassé après les nouveaux essais du client
+            print(f"Limite de débit atteinte lors de l'inférence : {e}")
+            return "Le service est très sollicité en ce moment, réessaie dans quelques instants.", None, ""
+
         except KeyError as e:
             # Gestion des erreurs liées à des clés manquantes
             error_message = f"Erreur lors de l'inférence : clé manquante dans les résultats - {e}"
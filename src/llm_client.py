@@ -0,0 +1,313 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import httpx
+from langchain.chat_models import ChatOpenAI
+from langchain.embeddings.openai import OpenAIEmbeddings
+from project_config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_RPM,
+    OPENAI_TPM,
+    LOCAL_LLM_BASE_URL,
+    LOCAL_LLM_MODEL
+)
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Token buckets for the request-per-minute and token-per-minute budgets, shared by every thread."""
+    def __init__(self, requests_per_minute=3500, tokens_per_minute=90000):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+        self._updated = now
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens fit in the budgets."""
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait_for = self._paused_until - now
+                if wait_for <= 0:
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    wait_for = max((1 - self._requests) * 60 / self.rpm, (tokens - self._tokens) * 60 / self.tpm)
+            time.sleep(max(wait_for, 0.01))
+
+    def try_acquire(self, tokens):
+        """Take one request and `tokens` tokens only if they are available right now; never blocks."""
+        tokens = min(tokens, self.tpm)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until or self._requests < 1 or self._tokens < tokens:
+                return False
+            self._requests -= 1
+            self._tokens -= tokens
+            return True
+
+    def pause(self, seconds):
+        """Hold every request for `seconds`, e.g. after the server answered 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """
+    httpx transport that schedules the requests against the rate limits
+    and retries transient failures with jittered backoff.
+    """
+    def __init__(self, limiter=None, max_retries=4, backoff_base=0.5, backoff_cap=20.0, max_connections=20):
+        """
+        :param limiter: RateLimiter shared by the clients; None disables the scheduling.
+        :param max_retries: Number of retries after a transient failure.
+        :param backoff_base: First backoff delay in seconds, doubled at each retry.
+        :param backoff_cap: Maximum backoff delay in seconds.
+        :param max_connections: Size of the connection pool.
+        """
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._transport = httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    @staticmethod
+    def _estimate_tokens(request):
+        """Rough token count of a request, about 4 bytes per token."""
+        return max(1, len(request.content) // 4)
+
+    def admit(self, request):
+        """Block until the limiter lets the request go."""
+        if self.limiter is not None:
+            self.limiter.acquire(self._estimate_tokens(request))
+
+    def try_admit(self, request):
+        """Let the request go only if the budgets have headroom right now (and no 429 pause is running)."""
+        return self.limiter is None or self.limiter.try_acquire(self._estimate_tokens(request))
+
+    def _send(self, request, admitted=False):
+        if not admitted:
+            self.admit(request)
+        response = self._transport.handle_request(request)
+        if response.status_code in RETRY_STATUS_CODES:
+            # Le corps est lu pour libérer la connexion avant un nouvel essai
+            response.read()
+        return response
+
+    def _backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after", 0)))
+            except ValueError:
+                pass
+            if response.status_code == 429 and self.limiter is not None:
+                self.limiter.pause(delay)
+        return delay
+
+    def handle_request(self, request, admitted=False):
+        """
+        Send the request, retrying transient failures.
+        :param admitted: The first attempt was already admitted by the limiter, e.g. by HedgingTransport.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._send(request, admitted=admitted and attempt == 0)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning("Erreur réseau vers %s (%s), nouvel essai dans %.1fs.", request.url.path, e, delay)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                logging.warning("Réponse %d de %s, nouvel essai dans %.1fs.", response.status_code, request.url.path, delay)
+                response.close()
+            time.sleep(delay)
+
+    def close(self):
+        self._transport.close()
+
+
+def _close_response(future):
+    """Release the connection of a hedged attempt that lost the race."""
+    if future.exception() is None:
+        future.result().close()
+
+
+class HedgingTransport(httpx.BaseTransport):
+    """
+    Thin per-model wrapper around a shared ResilientTransport: if a request is still pending
+    after the `percentile` of the recently observed latencies, a duplicate is raced against it
+    and the first successful answer wins.
+    The hedge clock starts once the request is admitted by the limiter and picked up by a worker,
+    so a request waiting for its rate budget is never duplicated; no duplicate is sent either
+    while the limiter is paused or out of headroom. A duplicate already sent cannot be cancelled
+    and its tokens are paid, hence the high percentile: about 1 request in 20 is hedged at p95.
+    """
+    def __init__(self, transport, percentile=95, min_samples=20, history=200, min_hedge_after=0.5, max_workers=20):
+        """
+        :param transport: ResilientTransport shared by every model calling the same server.
+        :param percentile: Percentile of the observed latencies after which a duplicate is sent.
+        :param min_samples: Number of observed latencies needed before hedging at all.
+        :param history: Number of recent latencies kept to compute the percentile.
+        :param min_hedge_after: Shortest delay before a duplicate, in seconds.
+        """
+        self.transport = transport
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_hedge_after = min_hedge_after
+        self.hedges = 0
+        self._latencies = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def hedge_after(self):
+        """Seconds after which a duplicate is sent, or None while too few latencies were observed."""
+        with self._lock:
+            if not self._latencies or len(self._latencies) < self.min_samples:
+                return None
+            return max(self.min_hedge_after, float(np.percentile(self._latencies, self.percentile)))
+
+    def _attempt(self, request, sent):
+        """Primary attempt, run by a worker: the hedge clock starts once it is admitted."""
+        self.transport.admit(request)
+        started = time.monotonic()
+        sent.set()
+        response = self.transport.handle_request(request, admitted=True)
+        if response.status_code not in RETRY_STATUS_CODES:
+            with self._lock:
+                self._latencies.append(time.monotonic() - started)
+        return response
+
+    def handle_request(self, request):
+        sent = threading.Event()
+        futures = [self._executor.submit(self._attempt, request, sent)]
+        hedge_after = self.hedge_after()
+        if hedge_after is not None:
+            # Ni la file des workers ni l'attente du budget ne comptent dans le délai de couverture
+            sent.wait()
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done and self.transport.try_admit(request):
+                self.hedges += 1
+                logging.info("Requête lente vers %s (> %.1fs), envoi d'une requête de couverture.", request.url.path, hedge_after)
+                futures.append(self._executor.submit(self.transport.handle_request, request, True))
+
+        # On attend la première réponse réussie ; une erreur n'est renvoyée que si tous les essais échouent
+        pending = set(futures)
+        fallback, error = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                response = future.result()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    for other in pending | (done - {future}):
+                        # Pas encore parti : annulé ; déjà envoyé : sa réponse est libérée à l'arrivée
+                        if not other.cancel():
+                            other.add_done_callback(_close_response)
+                    if fallback is not None:
+                        fallback.close()
+                    return response
+                if fallback is not None:
+                    fallback.close()
+                fallback = response
+        if fallback is not None:
+            return fallback
+        raise error
+
+    def close(self):
+        # Le transport partagé reste ouvert pour les autres modèles
+        self._executor.shutdown(wait=False)
+
+
+_transports = {}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(base_url=None, hedge_percentile=None):
+    """
+    Return an httpx client for base_url.
+    Every client of the same server shares one ResilientTransport, hence its connections and its rate budgets;
+    hedging is only added, per model, by a thin HedgingTransport on top of it.
+    :param hedge_percentile: Latency percentile after which a slow request is hedged; None disables hedging.
+    """
+    key = (base_url, hedge_percentile)
+    with _clients_lock:
+        if base_url not in _transports:
+            limiter = RateLimiter(OPENAI_RPM, OPENAI_TPM) if base_url == OPENAI_BASE_URL else None
+            _transports[base_url] = ResilientTransport(limiter=limiter)
+        if key not in _clients:
+            transport = _transports[base_url]
+            if hedge_percentile:
+                transport = HedgingTransport(transport, percentile=hedge_percentile)
+            _clients[key] = httpx.Client(transport=transport, timeout=httpx.Timeout(60.0, connect=5.0))
+        return _clients[key]
+
+
+def get_chat_model(model="gpt-3.5-turbo", temperature=0.3, hedge_percentile=95):
+    """
+    Chat model using the resilient client layer.
+    If LOCAL_LLM_BASE_URL is configured, the OpenAI-compatible local model takes over when OpenAI fails.
+    """
+    llm = ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        openai_api_key=OPENAI_API_KEY,
+        openai_api_base=OPENAI_BASE_URL,
+        http_client=get_http_client(OPENAI_BASE_URL, hedge_percentile),
+        max_retries=0  # Les nouveaux essais sont gérés par ResilientTransport
+    )
+    if not LOCAL_LLM_BASE_URL:
+        return llm
+
+    local_llm = ChatOpenAI(
+        model=LOCAL_LLM_MODEL,
+        temperature=temperature,
+        openai_api_key="local",
+        openai_api_base=LOCAL_LLM_BASE_URL,
+        http_client=get_http_client(LOCAL_LLM_BASE_URL),
+        max_retries=0
+    )
+    return llm.with_fallbacks([local_llm])
+
+
+def get_embeddings_model(model="text-embedding-ada-002"):
+    """
+    Embeddings using the resilient client layer.
+    No fallback here: a different model would not match the vectors already stored in the db.
+    """
+    embeddings = OpenAIEmbeddings(
+        model=model,
+        openai_api_key=OPENAI_API_KEY,
+        openai_api_base=OPENAI_BASE_URL,
+        http_client=get_http_client(OPENAI_BASE_URL),
+        max_retries=0
+    )
+    return embeddings
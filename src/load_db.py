@@ -1,4 +1,6 @@
 import os
+import sys
+import time
 import logging
 import shutil
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -6,6 +8,10 @@ from langchain_community.vectorstores import Chroma
 from langchain.docstore.document import Document
 from PyPDF2 import PdfReader
 import re
+import json
+from collections import Counter, defaultdict
+from pdf2image import convert_from_path
+from .shard_router import ShardedDB
 
 #import datetime
 
@@ -14,28 +20,78 @@ class DataLoader:
     def __init__(self, pdf_directory="/Users/drisschraibi/Desktop/RAG-Chatbot-with-Confluence/Cours_Marketing_Maths", persist_directory="./db"):
         self.pdf_directory = pdf_directory
         self.persist_directory = persist_directory
+        self.preview_directory = os.path.join(persist_directory, "previews")
 
-    def load_from_local_pdfs(self):
-        """Load documents from local PDF files."""
+    def shard_name(self, filepath):
+        """
+        Return the shard (Chroma collection) of a PDF file: one shard per course sub-directory,
+        "course_general" for the files at the root of pdf_directory.
+        """
+        relative_directory = os.path.relpath(os.path.dirname(os.path.abspath(filepath)), os.path.abspath(self.pdf_directory))
+        course = "general" if relative_directory == "." else relative_directory
+        name = "course_" + re.sub(r"[^A-Za-z0-9_-]+", "_", course)
+        # Contraintes Chroma : 3 à 63 caractères, en gardant de la place pour le suffixe de version
+        return name[:48].rstrip("_-")
+
+    def source_name(self, filepath):
+        """
+        Return the "source" of a PDF file: its path relative to pdf_directory, e.g. "Marketing/cours.pdf".
+        Two courses can then hold files with the same name without mixing their chunks, previews and viewer paths.
+        """
+        relative_path = os.path.relpath(os.path.abspath(filepath), os.path.abspath(self.pdf_directory))
+        if relative_path.startswith(os.pardir):
+            return os.path.basename(filepath)
+        return relative_path.replace(os.sep, "/")
+
+    @staticmethod
+    def collection_name(shard):
+        """Return a new versioned collection name for a shard, so it can be rebuilt next to the live one."""
+        return f"{shard}-v{time.time_ns() // 1000000:x}"
+
+    def drop_collection(self, collection_name, embeddings):
+        """Delete a collection that no longer serves queries."""
+        db = self.load_from_db(embeddings, collection_name=collection_name)
+        if db is None:
+            return
+        try:
+            db.delete_collection()
+            logging.info("Collection supprimée : %s", collection_name)
+        except Exception as e:
+            logging.warning("Impossible de supprimer la collection %s : %s", collection_name, e)
+
+    def list_shards(self):
+        """Return {shard name: [PDF file paths]} for every PDF under pdf_directory."""
+        shards = defaultdict(list)
+        for directory, _, filenames in os.walk(self.pdf_directory):
+            for filename in sorted(filenames):
+                if filename.endswith(".pdf"):
+                    filepath = os.path.join(directory, filename)
+                    shards[self.shard_name(filepath)].append(filepath)
+        return shards
+
+    def load_from_local_pdfs(self, filepaths=None):
+        """
+        Load documents from local PDF files.
+        :param filepaths: PDF files to load, e.g. those of a single shard. Defaults to every PDF under pdf_directory.
+        """
         if not os.path.exists(self.pdf_directory):
             logging.error("Le répertoire PDF n'existe pas : %s", self.pdf_directory)
             return []
         
-        fichiers_pdf = [f for f in os.listdir(self.pdf_directory) if f.endswith(".pdf")]
-        if not fichiers_pdf:
+        if filepaths is None:
+            filepaths = [filepath for files in self.list_shards().values() for filepath in files]
+        if not filepaths:
             logging.warning("Aucun fichier PDF trouvé dans le répertoire : %s", self.pdf_directory)
             return []
 
         docs = []
-        for filename in os.listdir(self.pdf_directory):
-            if filename.endswith(".pdf"):
-                filepath = os.path.join(self.pdf_directory, filename)
-                print("filepath", filepath)
-                try:
-                    doc_extrait = self._extract_text_from_pdf(filepath)
-                    docs.extend(doc_extrait)  # On ajoute chaque page extraite
-                except Exception as e:
-                    logging.error("Erreur lors du traitement du fichier PDF %s : %s", self.pdf_directory, e)
+        for filepath in filepaths:
+            print("filepath", filepath)
+            try:
+                doc_extrait = self._extract_text_from_pdf(filepath)
+                docs.extend(doc_extrait)  # On ajoute chaque page extraite
+            except Exception as e:
+                logging.error("Erreur lors du traitement du fichier PDF %s : %s", filepath, e)
                 
         logging.info("Chargement terminé : %d pages extraites.", len(docs))
         return docs
@@ -67,7 +123,7 @@ class DataLoader:
 
                     if text:  # Only process non-empty text
                         metadata = {
-                            "source": os.path.basename(filepath),
+                            "source": self.source_name(filepath),
                             "page": i + 1,
                         }
                         # Create Document object
@@ -127,7 +183,13 @@ class DataLoader:
 
             try:
                 chunks = splitter.split_text(doc.page_content)
+                offset = 0
                 for chunk in chunks:
+                    # Position du morceau dans le texte de la page, pour le surligner dans l'aperçu
+                    start_index = doc.page_content.find(chunk, offset)
+                    if start_index >= 0:
+                        offset = start_index + 1
+
                     #page_number = doc.metadata.get("page", "Page inconnue")
                     
                     # Logique de validation de la page
@@ -140,6 +202,7 @@ class DataLoader:
                             metadata={
                                 "source": doc.metadata.get("source", "Source inconnue"),
                                 "page": doc.metadata.get('page', "Page inconnue"),
+                                "start_index": start_index,
                             }
                         )
                     )
@@ -158,11 +221,17 @@ class DataLoader:
         return splitted_docs
 
 
-    def save_to_db(self, splitted_docs, embeddings):
-        """Save chunks to Chroma DB."""
+    def save_to_db(self, splitted_docs, embeddings, collection_name="langchain"):
+        """Save chunks to a Chroma DB collection."""
         try:
             logging.info("Enregistrement des documents dans la base de données Chroma...")
-            db = Chroma.from_documents(splitted_docs, embeddings, persist_directory=self.persist_directory)
+            db = Chroma.from_documents(
+                splitted_docs,
+                embeddings,
+                ids=self._chunk_ids(splitted_docs),
+                collection_name=collection_name,
+                persist_directory=self.persist_directory
+            )
             #db.persist()
             logging.info("Base de données Chroma enregistrée avec succès.")
             return db
@@ -171,11 +240,12 @@ class DataLoader:
             print("err")
             return None
 
-    def load_from_db(self, embeddings):
-        """Load chunks from Chroma DB."""
+    def load_from_db(self, embeddings, collection_name="langchain"):
+        """Load chunks from a Chroma DB collection."""
         try:
             logging.info("Chargement de la base de données Chroma...")
             db = Chroma(
+                collection_name=collection_name,
                 persist_directory=self.persist_directory,
                 embedding_function=embeddings
             )
@@ -185,8 +255,36 @@ class DataLoader:
             logging.error("Erreur lors du chargement de la base de données : %s", e)
             return None
 
+    def set_shard(self, shard, embeddings, collection_name):
+        """
+        Create, save and load the collection of a single shard.
+        The live collection of the shard is left untouched: ShardedDB swaps to the new one once it is built.
+        :param shard: Shard name, as returned by shard_name.
+        :param collection_name: New collection to build, as returned by collection_name.
+        :return: Chroma collection of the shard, None if it has no document.
+        """
+        # Load docs
+        filepaths = self.list_shards().get(shard, [])
+        docs = self.load_from_local_pdfs(filepaths)
+        if not docs:
+            logging.error("Aucun document chargé pour le shard %s. Collection non créée.", shard)
+            return None
+
+        # Split Docs
+        splitted_docs = self.split_docs(docs)
+
+        # Previews
+        pages_by_source = defaultdict(list)
+        for doc in docs:
+            pages_by_source[doc.metadata["source"]].append(doc)
+        for filepath in filepaths:
+            self.build_previews(filepath, pages_by_source.get(self.source_name(filepath), []))
+
+        # Save to DB
+        return self.save_to_db(splitted_docs, embeddings, collection_name=collection_name)
+
     def set_db(self, embeddings):
-        """Create, save, and load db."""
+        """Create, save, and load db: one collection per shard, behind a ShardedDB router."""
         if os.path.exists(self.persist_directory):
             try:
                 shutil.rmtree(self.persist_directory)
@@ -195,21 +293,147 @@ class DataLoader:
                 logging.warning("Impossible de réinitialiser le répertoire : %s", e)
         else : 
                 logging.info("Le répertoire n'existe pas encore, rien à réinitialiser : %s", self.persist_directory)
-        # Load docs
-        docs = self.load_from_local_pdfs()
-        if not docs:
+        shards, collections = {}, {}
+        for shard in self.list_shards():
+            collection_name = self.collection_name(shard)
+            db = self.set_shard(shard, embeddings, collection_name)
+            if db is not None:
+                shards[shard] = db
+                collections[shard] = collection_name
+        if not shards:
             logging.error("Aucun document chargé. Base de données non créée.")
             return None
+        return ShardedDB(self, embeddings, shards, collections)
 
-        # Split Docs
-        splitted_docs = self.split_docs(docs)
+    def get_db(self, embeddings):
+        """Load existing db from the collections listed in shards.json; a db built before sharding is served as a single shard."""
+        db = ShardedDB(self, embeddings, {})
+        db.reload()
+        if not db.shards:
+            legacy = self.load_from_db(embeddings)
+            if legacy is None:
+                return None
+            db = ShardedDB(self, embeddings, {"langchain": legacy}, {"langchain": "langchain"})
+        return db
 
-        # Save to DB
-        return self.save_to_db(splitted_docs, embeddings)
+    def build_previews(self, filepath, pages, dpi=30, quality=60):
+        """
+        Pre-render a low-resolution WebP thumbnail of every page and store the text layer of the pages.
+        The viewer can then show the pages instantly and highlight the chunks using their start_index.
+        :param filepath: Path to the PDF file.
+        :param pages: Page Documents extracted from this file by _extract_text_from_pdf.
+        :param dpi: Resolution of the thumbnails.
+        :param quality: WebP quality of the thumbnails.
+        :return: Path of the preview index of the file, None if it could not be written.
+        """
+        source = self.source_name(filepath)
+        output_directory = os.path.join(self.preview_directory, source)
+        shutil.rmtree(output_directory, ignore_errors=True)
+        os.makedirs(output_directory, exist_ok=True)
 
-    def get_db(self, embeddings):
-        """Load existing db."""
-        return self.load_from_db(embeddings)
+        index = {"source": source, "pages": {}}
+        for doc in pages:
+            index["pages"][str(doc.metadata["page"])] = {"text": doc.page_content, "thumbnail": None}
+
+        try:
+            for i, image in enumerate(convert_from_path(filepath, dpi=dpi)):
+                thumbnail = f"page-{i + 1:04d}.webp"
+                image.save(os.path.join(output_directory, thumbnail), "WEBP", quality=quality)
+                index["pages"].setdefault(str(i + 1), {"text": ""})["thumbnail"] = thumbnail
+        except Exception as e:
+            logging.error("Erreur lors du rendu des miniatures de %s : %s", filepath, e)
+
+        try:
+            index_path = os.path.join(output_directory, "index.json")
+            with open(index_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            logging.info("Aperçus générés pour %s (%d pages)", source, len(index["pages"]))
+            return index_path
+        except Exception as e:
+            logging.error("Erreur lors de l'enregistrement de l'index des aperçus de %s : %s", filepath, e)
+            return None
+
+    @staticmethod
+    def _chunk_ids(splitted_docs):
+        """
+        Build deterministic chunk ids of the form "source:page:rank".
+        Re-indexing a file therefore overwrites its previous chunks instead of duplicating them.
+        :param splitted_docs: List of split Document objects.
+        :return: List of ids, aligned with splitted_docs.
+        """
+        counters = Counter()
+        ids = []
+        for doc in splitted_docs:
+            key = f"{doc.metadata.get('source', 'Source inconnue')}:{doc.metadata.get('page', 'Page inconnue')}"
+            ids.append(f"{key}:{counters[key]}")
+            counters[key] += 1
+        return ids
+
+    def _source_chunks(self, db, source):
+        """Return the ids, embeddings and texts of every chunk of the given source file already stored in db."""
+        return db.get(where={"source": source}, include=["embeddings", "documents"])
+
+    def index_file(self, db, filepath):
+        """
+        Add or update the chunks of a single PDF in a live db.
+        New chunks are upserted before stale ones are deleted, so the file stays searchable during the update.
+        :param db: ShardedDB currently used to answer queries; the file goes to its course shard.
+        :param filepath: Path to the PDF file that was added or modified.
+        :return: Number of chunks indexed for this file.
+        """
+        shard = self.shard_name(filepath)
+        shard_db = db.get_shard(shard, create=True)
+        if shard_db is None:
+            return 0
+        source = self.source_name(filepath)
+        pages = self._extract_text_from_pdf(filepath)
+        self.build_previews(filepath, pages)
+        splitted_docs = self.split_docs(pages)
+        if not splitted_docs:
+            logging.warning("Aucun contenu indexable dans %s, suppression de ses anciens morceaux.", filepath)
+            self.remove_file(db, filepath)
+            return 0
+
+        try:
+            ids = self._chunk_ids(splitted_docs)
+            previous = self._source_chunks(shard_db, source)
+            stale_ids = set(previous["ids"]) - set(ids)
+            shard_db.add_documents(splitted_docs, ids=ids)
+            if stale_ids:
+                shard_db.delete(ids=list(stale_ids))
+            # Le résumé de routage est mis à jour avec les seuls morceaux de ce fichier
+            added = shard_db.get(ids=ids, include=["embeddings", "documents"])
+            db.update_summary(shard, added=added, removed=previous)
+            logging.info("Fichier indexé : %s (%d morceaux, %d obsolètes supprimés)", source, len(ids), len(stale_ids))
+            return len(ids)
+        except Exception as e:
+            logging.error("Erreur lors de l'indexation du fichier %s : %s", filepath, e)
+            return 0
+
+    def remove_file(self, db, filepath):
+        """
+        Remove every chunk of a deleted PDF from a live db.
+        :param db: ShardedDB currently used to answer queries.
+        :param filepath: Path of the removed PDF file.
+        :return: Number of chunks removed.
+        """
+        shard = self.shard_name(filepath)
+        shard_db = db.get_shard(shard)
+        if shard_db is None:
+            return 0
+        source = self.source_name(filepath)
+        shutil.rmtree(os.path.join(self.preview_directory, source), ignore_errors=True)
+        try:
+            previous = self._source_chunks(shard_db, source)
+            ids = previous["ids"]
+            if ids:
+                shard_db.delete(ids=ids)
+                db.update_summary(shard, removed=previous)
+            logging.info("Fichier retiré de la base : %s (%d morceaux)", source, len(ids))
+            return len(ids)
+        except Exception as e:
+            logging.error("Erreur lors de la suppression du fichier %s : %s", filepath, e)
+            return 0
 
 
 if __name__ == "__main__":
@@ -225,6 +449,14 @@ if __name__ == "__main__":
     from langchain.embeddings.openai import OpenAIEmbeddings
     embeddings = OpenAIEmbeddings()
 
+    # Exemple : reconstruire uniquement certains cours, ex. python -m src.load_db course_Marketing
+    shards = sys.argv[1:]
+    if shards:
+        db = data_loader.get_db(embeddings)
+        for shard in shards:
+            db.rebuild(shard)  # Les applications en cours basculent sur la nouvelle collection via shards.json
+        sys.exit(0)
+
     db = data_loader.set_db(embeddings)
     if db:
         logging.info("Base de données créée et prête à l'emploi.")
@@ -0,0 +1,313 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tabulate import tabulate
+from langchain_community.chat_models.fake import FakeListChatModel
+from dotenv import load_dotenv, find_dotenv
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+# project_config exige une clé à l'import : celle du .env d'abord (load_dotenv n'écrase pas une variable
+# déjà définie), une clé factice seulement si aucune n'est trouvée, ce qui suffit au mode hors ligne
+load_dotenv(find_dotenv())
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+
+from src.help_desk import HelpDesk
+from src.load_db import DataLoader
+from src.conversation import ConversationMemory
+from src.evaluate import open_evaluation_dataset
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "evaluation_dataset.tsv")
+
+FOLLOW_UPS = [
+    "Et pour le prix ?",
+    "Peux-tu donner un exemple ?",
+    "Pourquoi est-ce important ?",
+]
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embeddings with an injectable latency per call."""
+    latency: float = 0.0
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    """Fake chat model with an injectable latency per call (FakeListChatModel.sleep only applies to streaming)."""
+    latency: float = 0.0
+
+    def _call(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super()._call(*args, **kwargs)
+
+
+class CondenseFakeChatModel(SlowFakeChatModel):
+    """
+    Fake condensation: templates the follow-up with the previous question of the session,
+    so that each session keeps retrieving for its own topic instead of the canned answer.
+    """
+    def _call(self, messages, *args, **kwargs):
+        time.sleep(self.latency)
+        prompt = messages[-1].content
+        previous = re.findall(r"Étudiant : (.*)", prompt)
+        follow_up = re.search(r"Reformule la dernière question de l'étudiant : (.*)", prompt)
+        question = follow_up.group(1).strip() if follow_up else ""
+        return f"{question} ({previous[-1].strip()})" if previous else question
+
+
+class OfflineHelpDesk(HelpDesk):
+    """HelpDesk backed by fake LLM and embeddings, to load test without calling OpenAI."""
+    def __init__(self, llm_latency=0.5, embedding_latency=0.05, **kwargs):
+        self.llm_latency = llm_latency
+        self.embedding_latency = embedding_latency
+        super().__init__(**kwargs)
+
+    def get_llm(self):
+        return SlowFakeChatModel(
+            responses=["Le **marketing mix** regroupe le produit, le prix, la distribution et la communication."],
+            latency=self.llm_latency
+        )
+
+    def get_condense_llm(self):
+        return CondenseFakeChatModel(responses=[""], latency=self.llm_latency)
+
+    def get_embeddings(self):
+        return SlowFakeEmbeddings(size=1536, latency=self.embedding_latency)
+
+
+class InProcessTarget:
+    """Send the questions to HelpDesk.retrieval_qa_inference in this process."""
+    def __init__(self, model):
+        self.model = model
+
+    def ask(self, question, memory):
+        result = self.model.retrieval_qa_inference(question, verbose=False, memory=memory)
+        # En cas d'échec, retrieval_qa_inference renvoie un message d'erreur, seul ou sans sources
+        if not isinstance(result, tuple):
+            raise RuntimeError(result)
+        if result[1] is None:
+            raise RuntimeError(result[0])
+        return result[0]
+
+    def cache_stats(self):
+        stats = getattr(self.model, "cache_stats", None)
+        return stats() if stats else {}
+
+    def clear_caches(self):
+        clear = getattr(self.model, "clear_caches", None)
+        if clear:
+            clear()
+
+
+class HttpTarget:
+    """POST the questions as JSON to a served endpoint."""
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+
+    def ask(self, question, memory):
+        payload = json.dumps({"question": question, "history": memory.messages}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=payload, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read().decode("utf-8")
+
+    def cache_stats(self):
+        return {}
+
+    def clear_caches(self):
+        pass
+
+
+def make_variants(question, n_variants, rng):
+    """Return the question followed by n_variants synthetic rephrasings of it."""
+    templates = [
+        "{q}",
+        "Peux-tu m'expliquer : {q}",
+        "{q_lower}",
+        "J'ai une question : {q}",
+        "{q_nomark} ?",
+    ]
+    q_nomark = question.rstrip(" ?")
+    variants = [question]
+    for template in rng.sample(templates[1:], min(n_variants, len(templates) - 1)):
+        variants.append(template.format(q=question, q_lower=question.lower(), q_nomark=q_nomark))
+    return variants
+
+
+def build_sessions(questions, n_sessions, turns=2, n_variants=2, seed=0):
+    """
+    Build simulated student sessions from the dataset questions.
+    :param questions: Questions of the evaluation dataset.
+    :param n_sessions: Number of sessions to generate.
+    :param turns: Number of questions per session; turns after the first are follow-ups.
+    :param n_variants: Number of synthetic variants generated per dataset question.
+    :return: List of sessions, each a list of questions.
+    """
+    rng = random.Random(seed)
+    pool = [variant for question in questions for variant in make_variants(question, n_variants, rng)]
+    sessions = []
+    for _ in range(n_sessions):
+        session = [rng.choice(pool)]
+        session.extend(rng.choice(FOLLOW_UPS) for _ in range(turns - 1))
+        sessions.append(session)
+    return sessions
+
+
+class LoadTest:
+    """Replay sessions against a target at a given arrival rate and concurrency."""
+    def __init__(self, target, sessions, concurrency=4, rate=None, passes=1):
+        """
+        :param target: InProcessTarget or HttpTarget.
+        :param sessions: Sessions built by build_sessions.
+        :param concurrency: Maximum number of students served at the same time.
+        :param rate: New sessions per second (open loop); None starts them as fast as concurrency allows.
+        :param passes: Number of times the sessions are replayed, to measure the caches on re-runs.
+        """
+        self.target = target
+        self.sessions = sessions
+        self.concurrency = concurrency
+        self.rate = rate
+        self.passes = passes
+        self.memories = [ConversationMemory() for _ in sessions]
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._errors = 0
+
+    def _run_session(self, index, scheduled_at):
+        memory = self.memories[index]
+        memory.load_messages([])
+        for turn, question in enumerate(self.sessions[index]):
+            # La première question compte le temps d'attente dans la file : c'est lui qui révèle la saturation
+            start = scheduled_at if turn == 0 else time.perf_counter()
+            try:
+                answer = self.target.ask(question, memory)
+                ok = True
+            except Exception as e:
+                logging.debug("Requête en échec : %s", e)
+                answer, ok = "", False
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._latencies.append(elapsed)
+                self._errors += not ok
+            memory.add_message("user", question)
+            memory.add_message("assistant", answer)
+
+    def run(self):
+        """Run the load test and return the report."""
+        self._latencies, self._errors = [], 0
+        # Chaque niveau de concurrence part de caches froids : sinon les niveaux suivants d'un --sweep
+        # profiteraient des scores déjà calculés et leurs hit ratios seraient cumulés
+        self.target.clear_caches()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = []
+            for _ in range(self.passes):
+                for index in range(len(self.sessions)):
+                    if self.rate:
+                        delay = started + len(futures) / self.rate - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    futures.append(executor.submit(self._run_session, index, time.perf_counter()))
+                # Une passe après l'autre, pour qu'une même session ne tourne pas deux fois en parallèle
+                for future in futures:
+                    future.result()
+        return self.report(time.perf_counter() - started)
+
+    def cache_stats(self):
+        """Aggregate the hits and misses of the session memories and of the target caches."""
+        stats = {"condense": {"hits": 0, "misses": 0}}
+        for memory in self.memories:
+            for key, value in memory.cache_stats().items():
+                stats["condense"][key] += value
+        stats.update(self.target.cache_stats())
+        return stats
+
+    def report(self, duration):
+        latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+        total = len(self._latencies)
+        report = {
+            "concurrency": self.concurrency,
+            "requests": total,
+            "duration_s": round(duration, 2),
+            "throughput_rps": round(total / duration, 2) if duration else 0.0,
+            "error_rate": round(self._errors / total, 4) if total else 0.0,
+        }
+        for p in (50, 90, 95, 99):
+            report[f"p{p}_ms"] = round(float(np.percentile(latencies, p)) * 1000, 1)
+        report["max_ms"] = round(float(latencies.max()) * 1000, 1)
+        for name, stats in self.cache_stats().items():
+            lookups = stats["hits"] + stats["misses"]
+            report[f"{name}_hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test HelpDesk by replaying the evaluation dataset.")
+    parser.add_argument("--url", help="Served endpoint to POST the questions to; in-process HelpDesk otherwise.")
+    parser.add_argument("--online", action="store_true", help="Use the OpenAI backends and the existing db instead of fakes.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--pdf-directory", default="test", help="PDFs indexed for the offline run.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--variants", type=int, default=2)
+    parser.add_argument("--passes", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=None, help="New sessions per second.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sweep", help="Comma-separated concurrencies to find the saturation point, e.g. 1,2,4,8,16.")
+    parser.add_argument("--rerank", action="store_true", help="Enable the HelpDesk rerank stage (BM25).")
+    parser.add_argument("--rerank-model", default=None, help="Local cross-encoder for the rerank stage, e.g. the reranker CROSS_ENCODER_MODEL.")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    return parser.parse_args(argv)
+
+
+def build_target(args):
+    if args.url:
+        return HttpTarget(args.url)
+    if args.online:
+        return InProcessTarget(HelpDesk(new_db=False, rerank=args.rerank, rerank_model=args.rerank_model))
+    loader = DataLoader(pdf_directory=args.pdf_directory, persist_directory="./db/load_test")
+    model = OfflineHelpDesk(
+        llm_latency=args.llm_latency,
+        embedding_latency=args.embedding_latency,
+        new_db=True,
+        loader=loader,
+        rerank=args.rerank,
+        rerank_model=args.rerank_model
+    )
+    return InProcessTarget(model)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    questions = open_evaluation_dataset(args.dataset)["Questions"].dropna().tolist()
+    sessions = build_sessions(questions, args.sessions, args.turns, args.variants)
+    target = build_target(args)
+
+    concurrencies = [int(c) for c in args.sweep.split(",")] if args.sweep else [args.concurrency]
+    reports = [
+        LoadTest(target, sessions, concurrency=c, rate=args.rate, passes=args.passes).run()
+        for c in concurrencies
+    ]
+    print(tabulate(reports, headers="keys", tablefmt="github"))
+    return reports
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(sys.argv[1:])
@@ -0,0 +1,159 @@
+import os
+import time
+import logging
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Pas de watchdog : on se rabat sur le polling
+    Observer = None
+    FileSystemEventHandler = object
+
+
+# Seuls ces événements signalent un contenu modifié. Les lectures ("opened", "closed_no_write"),
+# y compris celles de l'indexation ou du PDFViewer, relanceraient sinon l'indexation en boucle.
+CHANGE_EVENT_TYPES = {"created", "modified", "deleted", "moved", "closed"}
+
+
+class _PDFEventHandler(FileSystemEventHandler):
+    """Forward inotify events about changed PDF files to the watcher."""
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in CHANGE_EVENT_TYPES:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if path and path.endswith(".pdf"):
+                self.watcher.notify(path)
+
+
+class PDFWatcher:
+    """Watch the PDF directory and keep a live Chroma db in sync with it."""
+    def __init__(self, loader, db, debounce=2.0, poll_interval=5.0, use_inotify=True):
+        """
+        :param loader: DataLoader used to extract, split and index the files.
+        :param db: ShardedDB currently used to answer queries.
+        :param debounce: Seconds without new event before a burst of changes is applied.
+        :param poll_interval: Seconds between two scans of the directory when inotify is unavailable.
+        :param use_inotify: Use watchdog (inotify) when installed, otherwise poll the directory.
+        """
+        self.loader = loader
+        self.db = db
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and Observer is not None
+        self._pending = set()
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+        self._snapshot = {}
+
+    def notify(self, path):
+        """Register a changed path; it will be processed once the burst is over."""
+        with self._lock:
+            self._pending.add(os.path.abspath(path))
+            self._last_event = time.monotonic()
+        self._wake.set()
+
+    def start(self):
+        """Start watching the directory in background threads."""
+        if not os.path.isdir(self.loader.pdf_directory):
+            logging.error("Le répertoire PDF n'existe pas : %s", self.loader.pdf_directory)
+            return self
+
+        if self.use_inotify:
+            self._observer = Observer()
+            self._observer.schedule(_PDFEventHandler(self), self.loader.pdf_directory, recursive=True)
+            self._observer.start()
+            logging.info("Surveillance inotify du répertoire : %s", self.loader.pdf_directory)
+        else:
+            self._snapshot = self._scan()
+            self._start_thread(self._poll)
+            logging.info("Surveillance par polling (%ss) du répertoire : %s", self.poll_interval, self.loader.pdf_directory)
+
+        self._start_thread(self._run)
+        return self
+
+    def stop(self):
+        """Stop watching and apply the changes still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _start_thread(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _scan(self):
+        """Return {path: (mtime, size)} for every PDF file of the directory and of its course sub-directories."""
+        snapshot = {}
+        for directory, _, filenames in os.walk(self.loader.pdf_directory):
+            for filename in filenames:
+                if filename.endswith(".pdf"):
+                    path = os.path.abspath(os.path.join(directory, filename))
+                    try:
+                        stat = os.stat(path)
+                        snapshot[path] = (stat.st_mtime, stat.st_size)
+                    except OSError as e:
+                        logging.error("Erreur lors de la lecture de %s : %s", path, e)
+        return snapshot
+
+    def _poll(self):
+        """Fallback watcher: compare successive scans of the directory."""
+        while not self._stop.wait(self.poll_interval):
+            snapshot = self._scan()
+            for path in snapshot.keys() | self._snapshot.keys():
+                if snapshot.get(path) != self._snapshot.get(path):
+                    self.notify(path)
+            self._snapshot = snapshot
+
+    def _run(self):
+        """Wait for a quiet period after the last event, then apply the pending changes."""
+        while not self._stop.is_set():
+            self._wake.wait()
+            with self._lock:
+                quiet_for = time.monotonic() - self._last_event
+            if quiet_for < self.debounce and not self._stop.is_set():
+                self._stop.wait(self.debounce - quiet_for)
+                continue
+
+            with self._lock:
+                paths, self._pending = self._pending, set()
+                self._wake.clear()
+            self._apply(paths)
+
+    def _apply(self, paths):
+        """Index or remove each changed file in the live db."""
+        for path in sorted(paths):
+            if os.path.exists(path):
+                self.loader.index_file(self.db, path)
+            else:
+                self.loader.remove_file(self.db, path)
+
+
+if __name__ == "__main__":
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from src.load_db import DataLoader
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Mode ingestion continue : la base existante est mise à jour à chaque dépôt de fichier
+    data_loader = DataLoader()
+    db = data_loader.get_db(OpenAIEmbeddings())
+    watcher = PDFWatcher(data_loader, db).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -0,0 +1,156 @@
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any
+import numpy as np
+from langchain.retrievers.document_compressors.base import BaseDocumentCompressor
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # Pas de modèle local : score lexical BM25
+    CrossEncoder = None
+
+
+# Cross-encoder multilingue conseillé ; téléchargé depuis Hugging Face seulement s'il est demandé explicitement
+CROSS_ENCODER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class Reranker:
+    """Score query–chunk pairs in one batched call, with a cache of the pair scores."""
+    def __init__(self, model_name=None, cache_size=4096, k1=1.5, b=0.75, rrf_k=60):
+        """
+        :param model_name: Local cross-encoder run on CPU, e.g. CROSS_ENCODER_MODEL (opt-in, downloaded on first use).
+                           None, or sentence-transformers missing, falls back to BM25.
+        :param cache_size: Maximum number of pair scores cached.
+        :param k1: BM25 term frequency saturation.
+        :param b: BM25 length normalization.
+        :param rrf_k: Reciprocal-rank fusion constant used to merge the BM25 and retriever rankings.
+        """
+        self.cache_size = cache_size
+        self.k1 = k1
+        self.b = b
+        self.rrf_k = rrf_k
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.model = None
+        if model_name and CrossEncoder is not None:
+            try:
+                self.model = CrossEncoder(model_name, device="cpu")
+            except Exception as e:
+                logging.warning("Cross-encoder %s indisponible (%s), score lexical utilisé.", model_name, e)
+        elif model_name:
+            logging.info("sentence-transformers non installé, score lexical utilisé pour le reranking.")
+
+    @staticmethod
+    def _tokenize(text):
+        return re.findall(r"\w+", text.lower())
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _lexical_scores(self, query, texts):
+        """BM25 scores of texts for query, with idf computed on the candidates."""
+        terms = list(dict.fromkeys(self._tokenize(query)))
+        if not terms or not texts:
+            return np.zeros(len(texts))
+        index = {term: j for j, term in enumerate(terms)}
+        tf = np.zeros((len(texts), len(terms)))
+        lengths = np.zeros(len(texts))
+        for i, text in enumerate(texts):
+            tokens = self._tokenize(text)
+            lengths[i] = len(tokens)
+            for token in tokens:
+                j = index.get(token)
+                if j is not None:
+                    tf[i, j] += 1
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1))
+        return (tf * (self.k1 + 1) / (tf + norm[:, None])) @ idf
+
+    def _model_scores(self, query, texts):
+        """Cross-encoder scores of texts for query, in a single batched call."""
+        return np.asarray(self.model.predict([(query, text) for text in texts], batch_size=32))
+
+    def score(self, query, texts):
+        """
+        Score every text against query; only the pairs missing from the cache are computed.
+        Cross-encoder scores are cached per (query, text) pair. BM25 scores depend on the whole candidate set
+        through the idf, which is part of the cache key: they only hit when the same query and candidates come back.
+        :return: numpy array of scores, aligned with texts (higher is better).
+        """
+        hashes = [self._hash(text) for text in texts]
+        # Le score BM25 dépend de l'ensemble des candidats (idf) : il fait partie de la clé
+        context = "" if self.model is not None else self._hash("".join(sorted(hashes)))
+        keys = [(query, context, h) for h in hashes]
+
+        scores = np.zeros(len(texts))
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    scores[i] = self._cache[key]
+                    self._cache.move_to_end(key)
+                else:
+                    missing.append(i)
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return scores
+
+        if self.model is None:
+            # Les scores lexicaux se calculent sur l'ensemble complet des candidats
+            computed = self._lexical_scores(query, texts)[missing]
+        else:
+            computed = self._model_scores(query, [texts[i] for i in missing])
+        scores[missing] = computed
+
+        with self._lock:
+            for i, value in zip(missing, computed):
+                self._cache[keys[i]] = float(value)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query, documents, top_n=3):
+        """
+        Return the top_n documents for query, best first.
+        :param documents: Candidates in the retriever order, most similar first.
+        Without a cross-encoder, the BM25 ranking is fused with the retriever ranking (reciprocal-rank fusion):
+        BM25 alone would push down relevant chunks that share no word with the query, e.g. other inflections.
+        """
+        if not documents:
+            return []
+        scores = self.score(query, [doc.page_content for doc in documents])
+        if self.model is None:
+            lexical_rank = np.empty(len(scores))
+            lexical_rank[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+            dense_rank = np.arange(len(scores))
+            scores = 1 / (self.rrf_k + 1 + lexical_rank) + 1 / (self.rrf_k + 1 + dense_rank)
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return [documents[i] for i in order]
+
+    def cache_stats(self):
+        """Return the hits and misses of the pair scores cache."""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def clear_cache(self):
+        """Empty the pair scores cache and reset its hits and misses."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class RerankCompressor(BaseDocumentCompressor):
+    """Plug the Reranker into a ContextualCompressionRetriever."""
+    reranker: Any
+    top_n: int = 3
+
+    def compress_documents(self, documents, query, callbacks=None):
+        return self.reranker.rerank(query, list(documents), self.top_n)
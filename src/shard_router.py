@@ -0,0 +1,301 @@
+import os
+import re
+import json
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+import numpy as np
+from langchain.schema import BaseRetriever
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus, seulement entre threads
+    fcntl = None
+
+# Mots outils fréquents dans tous les cours : ils ne distinguent aucun shard
+STOPWORDS = {
+    "alors", "ainsi", "après", "aussi", "autre", "autres", "avant", "avec", "avoir", "celle", "celles", "cela",
+    "celui", "ceux", "chaque", "chez", "comme", "comment", "dans", "depuis", "donc", "dont", "elle", "elles",
+    "encore", "entre", "était", "être", "fait", "faire", "font", "leur", "leurs", "lors", "mais", "même",
+    "nous", "notre", "page", "parce", "peut", "peuvent", "plus", "pour", "pourquoi", "quand", "quel", "quelle",
+    "quelles", "quels", "sans", "selon", "sera", "sont", "sous", "tout", "toute", "toutes", "tous", "très",
+    "votre", "vous",
+}
+
+
+class ShardedDB:
+    """Per-course Chroma collections, searched through a router that only queries the relevant shards."""
+    def __init__(self, loader, embeddings, shards, collections=None, max_shards=3, keyword_weight=0.2, n_keywords=50):
+        """
+        :param loader: DataLoader that built the shards.
+        :param embeddings: Embeddings shared by every shard.
+        :param shards: Dictionary {shard name: Chroma collection}.
+        :param collections: Dictionary {shard name: collection name}; defaults to the shard names.
+        :param max_shards: Maximum number of shards searched per query.
+        :param keyword_weight: Weight of the keyword overlap in the routing score, next to the centroid similarity.
+        :param n_keywords: Number of keywords kept in the summary of a shard.
+        """
+        self.loader = loader
+        self.embeddings = embeddings
+        self.shards = dict(shards)
+        self.collections = dict(collections) if collections else {name: name for name in shards}
+        self.max_shards = max_shards
+        self.keyword_weight = keyword_weight
+        self.n_keywords = n_keywords
+        self.summaries_path = os.path.join(loader.persist_directory, "shards.json")
+        self.summaries = {}
+        self._summaries_mtime = None
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_shards)
+        for name in list(self.shards):
+            self.refresh_summary(name)
+
+    @staticmethod
+    def _tokenize(text):
+        return [token for token in re.findall(r"\w+", text.lower()) if len(token) > 3 and token not in STOPWORDS]
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Serialize the read-modify-write cycles of shards.json, between threads and between processes
+        (the app and its watcher on one side, a `python -m src.load_db <shard>` rebuild on the other).
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.summaries_path) or ".", exist_ok=True)
+            with open(f"{self.summaries_path}.lock", "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_summaries(self):
+        """Return the summaries stored in shards.json, as written: running sums and term counts."""
+        try:
+            with open(self.summaries_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.error("Erreur lors du chargement des résumés de shards : %s", e)
+            return {}
+
+    def _write_summaries(self, summaries):
+        """Write shards.json atomically: the other processes never read a half-written file. Call it under _file_lock."""
+        try:
+            tmp_path = f"{self.summaries_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(summaries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.summaries_path)
+        except Exception as e:
+            logging.error("Erreur lors de l'enregistrement des résumés de shards : %s", e)
+
+    def _routing_summaries(self, summaries):
+        """
+        Add the centroid and the keywords used by route to the stored summaries.
+        Keywords are weighted by tf-idf across shards: a word found in every shard does not help to route.
+        """
+        shard_frequency = Counter(token for summary in summaries.values() for token in summary.get("terms") or {})
+        routing = {}
+        for name, summary in summaries.items():
+            total = np.asarray(summary.get("sum") or [], dtype=float)
+            norm = np.linalg.norm(total) if total.size else 0.0
+            weights = Counter({
+                token: count * np.log((1 + len(summaries)) / (1 + shard_frequency[token]))
+                for token, count in (summary.get("terms") or {}).items()
+            })
+            routing[name] = {
+                **summary,
+                "centroid": total / norm if norm else None,
+                "keywords": [token for token, weight in weights.most_common(self.n_keywords) if weight > 0],
+            }
+        return routing
+
+    def reload(self):
+        """
+        Pick up the collections swapped by a rebuild, possibly run by another process.
+        Cheap when shards.json did not change: a single stat per call.
+        """
+        try:
+            mtime = os.stat(self.summaries_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._summaries_mtime:
+            return
+
+        summaries = self._read_summaries()
+        with self._lock:
+            self._summaries_mtime = mtime
+            for name, summary in summaries.items():
+                collection_name = summary.get("collection", name)
+                if self.collections.get(name) == collection_name:
+                    continue
+                shard = self.loader.load_from_db(self.embeddings, collection_name=collection_name)
+                if shard is not None:
+                    self.shards[name] = shard
+                    self.collections[name] = collection_name
+                    logging.info("Shard %s servi par la collection %s", name, collection_name)
+            # Seuls les shards retirés de shards.json sont retirés ; un shard pas encore résumé reste servi
+            for name in list(self.shards):
+                if name in self.summaries and name not in summaries:
+                    self.shards.pop(name)
+                    self.collections.pop(name, None)
+            self.summaries = self._routing_summaries(summaries)
+
+    def _summarize(self, content):
+        """Running sum of the embeddings, number of chunks and term counts of a Chroma `get` result."""
+        vectors = content.get("embeddings")
+        total = np.sum(np.asarray(vectors, dtype=float), axis=0).tolist() if vectors is not None and len(vectors) else None
+        terms = Counter(token for text in content.get("documents") or [] for token in self._tokenize(text))
+        return {"sum": total, "count": len(content.get("ids") or []), "terms": dict(terms)}
+
+    def refresh_summary(self, name):
+        """Recompute the summary of a shard from all its chunks, e.g. once it is built."""
+        self.reload()
+        with self._lock:
+            shard = self.shards.get(name)
+            collection_name = self.collections.get(name, name)
+        if shard is None:
+            return
+        # Lecture de tout le shard hors verrou : elle est en O(shard)
+        summary = self._summarize(shard.get(include=["embeddings", "documents"]))
+        with self._file_lock():
+            summaries = self._read_summaries()
+            previous = summaries.get(name, {})
+            if previous and previous.get("collection", name) != collection_name:
+                logging.info("Shard %s reconstruit entre-temps, résumé de %s ignoré.", name, collection_name)
+            else:
+                summaries[name] = {**summary, "collection": collection_name, "retired": previous.get("retired", [])}
+                self._write_summaries(summaries)
+        self.reload()
+
+    def update_summary(self, name, added=None, removed=None):
+        """
+        Apply the chunks added to and removed from a shard to its running sums, without reading the whole shard.
+        :param added: Chroma `get` result (ids, embeddings, documents) of the chunks written.
+        :param removed: Chroma `get` result of the chunks they replace or that were deleted.
+        """
+        with self._lock:
+            collection_name = self.collections.get(name, name)
+        with self._file_lock():
+            summaries = self._read_summaries()
+            summary = summaries.get(name)
+            if summary is not None and summary.get("collection", name) == collection_name:
+                for content, sign in ((added, 1), (removed, -1)):
+                    if not content:
+                        continue
+                    change = self._summarize(content)
+                    if change["sum"] is not None:
+                        total = np.asarray(summary.get("sum") or np.zeros(len(change["sum"])), dtype=float)
+                        summary["sum"] = (total + sign * np.asarray(change["sum"])).tolist()
+                    summary["count"] = max(0, summary.get("count", 0) + sign * change["count"])
+                    terms = Counter(summary.get("terms") or {})
+                    terms.update({token: sign * count for token, count in change["terms"].items()})
+                    summary["terms"] = {token: count for token, count in terms.items() if count > 0}
+                self._write_summaries(summaries)
+        if summary is None:
+            # Nouveau shard (nouveau dossier de cours) : il est encore petit, on le résume en entier
+            self.refresh_summary(name)
+            return
+        if summary.get("collection", name) != collection_name:
+            logging.info("Shard %s reconstruit entre-temps, mise à jour de %s ignorée.", name, collection_name)
+        self.reload()
+
+    def get_shard(self, name, create=False):
+        """Return the collection of a shard; create it, e.g. for a new course folder, if asked."""
+        self.reload()
+        with self._lock:
+            if name not in self.shards and create:
+                collection_name = self.loader.collection_name(name)
+                shard = self.loader.load_from_db(self.embeddings, collection_name=collection_name)
+                if shard is not None:
+                    self.shards[name] = shard
+                    self.collections[name] = collection_name
+            return self.shards.get(name)
+
+    def rebuild(self, name):
+        """
+        Rebuild a single shard from its PDF files into a new collection, then swap it in.
+        The shard keeps serving from its previous collection during the rebuild, and the other shards are untouched.
+        """
+        collection_name = self.loader.collection_name(name)
+        shard = self.loader.set_shard(name, self.embeddings, collection_name)
+        summary = self._summarize(shard.get(include=["embeddings", "documents"])) if shard is not None else None
+        with self._file_lock():
+            summaries = self._read_summaries()
+            previous = summaries.get(name, {})
+            # Collections retirées au rebuild précédent : plus aucun processus ne les sert
+            stale = previous.get("retired", [])
+            retired = [previous["collection"]] if "collection" in previous else []
+            if summary is None:
+                summaries.pop(name, None)
+                stale = stale + retired
+            else:
+                summaries[name] = {**summary, "collection": collection_name, "retired": retired}
+            self._write_summaries(summaries)
+            with self._lock:
+                if shard is None:
+                    self.shards.pop(name, None)
+                    self.collections.pop(name, None)
+                else:
+                    self.shards[name] = shard
+                    self.collections[name] = collection_name
+        self.reload()
+        for stale_collection in stale:
+            self.loader.drop_collection(stale_collection, self.embeddings)
+        return shard
+
+    def route(self, query, query_embedding):
+        """Return the names of the shards to search, most relevant first."""
+        with self._lock:
+            candidates = [(name, self.summaries.get(name)) for name in self.shards]
+        if len(candidates) <= self.max_shards:
+            return [name for name, _ in candidates]
+
+        query_embedding = np.asarray(query_embedding, dtype=float)
+        query_embedding /= np.linalg.norm(query_embedding) or 1.0
+        terms = set(self._tokenize(query))
+        scores = []
+        for name, summary in candidates:
+            if not summary or summary["centroid"] is None:
+                continue
+            score = float(summary["centroid"] @ query_embedding)
+            if terms:
+                score += self.keyword_weight * len(terms & set(summary["keywords"])) / len(terms)
+            scores.append((score, name))
+        return [name for _, name in sorted(scores, reverse=True)[:self.max_shards]]
+
+    def similarity_search_with_score(self, query, k=4):
+        """Search the routed shards in parallel and merge their top-k by distance."""
+        self.reload()
+        query_embedding = self.embeddings.embed_query(query)
+        names = self.route(query, query_embedding)
+        with self._lock:
+            shards = [self.shards[name] for name in names if name in self.shards]
+        results = self._executor.map(
+            lambda shard: shard.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k),
+            shards
+        )
+        merged = [pair for result in results for pair in result]
+        return sorted(merged, key=lambda pair: pair[1])[:k]
+
+    def similarity_search(self, query, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def as_retriever(self, search_kwargs=None):
+        return ShardedRetriever(db=self, k=(search_kwargs or {}).get("k", 4))
+
+
+class ShardedRetriever(BaseRetriever):
+    """LangChain retriever over a ShardedDB."""
+    db: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.db.similarity_search(query, k=self.k)
@@ -3,6 +3,7 @@ from src.help_desk import HelpDesk
 from pdf2image import convert_from_path
 import src.PdfViewer
 from src.PdfViewer import PDFViewer
+from src.conversation import ConversationMemory
 import os
 
 # Bannière et titre
@@ -14,7 +15,7 @@ st.markdown("**Votre professeur personnalisé pour répondre à toutes vos quest
 # Caching du modèle
 @st.cache_resource
 def get_model():
-    model = HelpDesk(new_db=True)
+    model = HelpDesk(new_db=True, watch=True)
     return model
 
 if "model" not in st.session_state:
@@ -26,6 +27,10 @@ model = st.session_state["model"]
 if "messages" not in st.session_state:
     st.session_state["messages"] = [{"role": "assistant", "content": "Bonjour ! Je suis Mr.Skill. Comment puis-je vous aider aujourd'hui ?"}]
 
+# Mémoire de conversation propre à la session
+if "memory" not in st.session_state:
+    st.session_state["memory"] = ConversationMemory()
+
 # Affichage des messages dans l'interface
 for msg in st.session_state.messages:
     if msg["role"] == "assistant":
@@ -35,12 +40,17 @@ for msg in st.session_state.messages:
 
 # Saisie utilisateur
 if prompt := st.chat_input("Posez votre question à Mr.Skill !"):
+    # Alimenter la mémoire avec l'historique avant la nouvelle question
+    st.session_state.memory.load_messages(st.session_state.messages)
+
     # Ajouter la question de l'utilisateur
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.chat_message("user").write(prompt)
 
     # Obtenir la réponse
-    response, s_organizer, sources = model.retrieval_qa_inference(prompt)
+    result = model.retrieval_qa_inference(prompt, memory=st.session_state.memory)
+    # Les erreurs renvoient un simple message, ou un message sans sources (s_organizer à None)
+    response, s_organizer, sources = result if isinstance(result, tuple) else (result, None, "")
 
     # Ajouter la réponse
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -48,9 +58,14 @@ if prompt := st.chat_input("Posez votre question à Mr.Skill !"):
 
     # Bouton pour afficher les sources
     pdf_directory = "/Users/drisschraibi/Desktop/RAG-Chatbot-with-Confluence/Cours_Marketing_Maths"  # Répertoire contenant vos fichiers PDF locaux
-    if sources:
+    if sources and s_organizer is not None:
         if st.button("📂 Afficher les sources"):
-            viewer = PDFViewer(s_organizer.get_organized_sources(), s_organizer.generate_file_paths(pdf_directory))
+            viewer = PDFViewer(
+                s_organizer.get_organized_sources(),
+                s_organizer.generate_file_paths(pdf_directory),
+                preview_directory=model.loader.preview_directory,
+                passages=s_organizer.get_passages(),
+            )
             viewer.display()
 
 # Footer sympa
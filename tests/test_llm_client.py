@@ -0,0 +1,77 @@
+import os
+import time
+import threading
+import httpx
+import pytest
+
+pytest.importorskip("langchain")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from src.llm_client import RateLimiter, ResilientTransport, HedgingTransport
+from src.fake_openai_server import serve
+
+
+@pytest.fixture
+def fake_server():
+    """Start the fake OpenAI server on an ephemeral port; call it with FakeOpenAIHandler overrides."""
+    servers = []
+
+    def start(**options):
+        server = serve(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(client, url):
+    return client.post(url, json={"model": "fake", "messages": [{"role": "user", "content": "Bonjour"}]})
+
+
+def test_retries_after_429_and_honours_retry_after(fake_server):
+    server, url = fake_server(latency=0.0, jitter=0.0, fail_requests={1})
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=10 ** 6)
+    client = httpx.Client(transport=ResilientTransport(limiter=limiter, backoff_base=0.01))
+
+    started = time.monotonic()
+    response = post(client, url)
+
+    assert response.status_code == 200
+    assert server.requests == 2
+    # Retry-After: 1 l'emporte sur le backoff de 10 ms
+    assert time.monotonic() - started >= 1.0
+
+
+def test_hedges_a_request_slower_than_the_observed_latencies(fake_server):
+    server, url = fake_server(latency=0.02, jitter=0.0, slow_requests={21}, slow_latency=2.0)
+    transport = HedgingTransport(ResilientTransport(), min_samples=20, min_hedge_after=0.1)
+    client = httpx.Client(transport=transport)
+    for _ in range(20):
+        post(client, url)
+    assert transport.hedges == 0
+
+    started = time.monotonic()
+    response = post(client, url)
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1.0
+    assert transport.hedges == 1
+    assert server.requests == 22
+
+
+def test_does_not_hedge_without_rate_budget(fake_server):
+    server, url = fake_server(latency=0.02, jitter=0.0, slow_requests={21}, slow_latency=0.5)
+    # 21 requêtes de budget : la requête lente prend la dernière, la couverture n'a plus de place
+    limiter = RateLimiter(requests_per_minute=21, tokens_per_minute=10 ** 6)
+    transport = HedgingTransport(ResilientTransport(limiter=limiter), min_samples=20, min_hedge_after=0.1)
+    client = httpx.Client(transport=transport)
+    for _ in range(21):
+        response = post(client, url)
+
+    assert response.status_code == 200
+    assert transport.hedges == 0
+    assert server.requests == 21